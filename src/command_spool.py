@@ -0,0 +1,217 @@
+"""
+Store-and-forward spool untuk perintah MQTT keluar.
+
+Perintah ditulis dulu ke journal di disk (JSON lines), lalu di-publish QoS 1
+secara berurutan dan pipelined begitu koneksi tersedia. Entry dianggap selesai
+setelah PUBACK dari broker (on_publish). Entry yang kedaluwarsa dibuang saat
+flush, sehingga START_PUMP dari jam lalu tidak tiba-tiba dieksekusi.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+# Masa berlaku default per perintah (detik)
+COMMAND_TTL = {
+    "START_PUMP": 60,
+    "STOP_PUMP": 300,
+    "ALARM_OFF": 300,
+    "RESET_USE_COUNT": 3600,
+}
+DEFAULT_TTL = 120
+
+# Perintah baru menggantikan entry pending (topic sama) dari perintah di set ini:
+# klik STOP_PUMP berulang jadi satu, dan START/STOP terakhir yang berlaku.
+DEDUP_RULES = {
+    "START_PUMP": {"START_PUMP", "STOP_PUMP"},
+    "STOP_PUMP": {"START_PUMP", "STOP_PUMP"},
+    "ALARM_OFF": {"ALARM_OFF"},
+    "RESET_USE_COUNT": {"RESET_USE_COUNT"},
+}
+
+QOS = 1
+
+# Journal disimpan di samping script, bukan di working directory saat dashboard dijalankan
+DEFAULT_SPOOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "command_spool.jsonl")
+
+
+class CommandSpool:
+    """Antrian perintah durable dengan expiry, dedup dan metrik"""
+
+    def __init__(self, client, path=DEFAULT_SPOOL_PATH, max_inflight=20):
+        self.client = client
+        self.path = path
+        self.max_inflight = max_inflight
+        self.connected = False
+
+        self._lock = threading.Lock()
+        self._pending = []   # entry belum di-publish, urut FIFO
+        self._inflight = {}  # mid -> entry, menunggu PUBACK
+        self._acked = deque()  # (mid, waktu ack) dari thread network paho
+        self._journal_records = 0
+
+        self.stats = {
+            "enqueued": 0,
+            "deduped": 0,
+            "expired": 0,
+            "flushed": 0,
+            "last_flush_latency": None,
+            "avg_flush_latency": None,
+        }
+
+        self._load()
+
+    # ---------- journal ----------
+    def _load(self):
+        """Replay journal: entry 'add' tanpa 'done' masih pending"""
+        if not os.path.exists(self.path):
+            return
+        entries = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # baris terakhir bisa terpotong saat crash
+                if record.get("op") == "add":
+                    entries[record["id"]] = record["entry"]
+                elif record.get("op") == "done":
+                    entries.pop(record["id"], None)
+        self._pending = list(entries.values())
+        self._compact()
+        if self._pending:
+            print(f"📦 Spool: {len(self._pending)} perintah tertunda dimuat dari {self.path}")
+
+    def _append(self, *records):
+        """Tulis record ke journal dengan satu fsync untuk semuanya"""
+        if not records:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_records += len(records)
+
+    def _compact(self):
+        """Tulis ulang journal hanya dengan entry yang belum selesai"""
+        tmp_path = self.path + ".tmp"
+        outstanding = list(self._inflight.values()) + self._pending
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in outstanding:
+                f.write(json.dumps({"op": "add", "id": entry["id"], "entry": entry}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._journal_records = len(outstanding)
+
+    # ---------- API ----------
+    def submit(self, topic, command, ttl=None, extra=None):
+        """Masukkan perintah ke spool lalu flush jika terhubung; return entry id"""
+        now = time.time()
+        payload = {"command": command, "timestamp": datetime.now().isoformat()}
+        if extra:
+            payload.update(extra)
+        entry = {
+            "id": uuid.uuid4().hex,
+            "topic": topic,
+            "command": command,
+            "payload": payload,
+            "created": now,
+            "expires": now + (ttl if ttl is not None else COMMAND_TTL.get(command, DEFAULT_TTL)),
+        }
+
+        with self._lock:
+            superseded = DEDUP_RULES.get(command, set())
+            kept, records = [], []
+            for old in self._pending:
+                if old["topic"] == topic and old["command"] in superseded:
+                    records.append({"op": "done", "id": old["id"]})
+                    self.stats["deduped"] += 1
+                else:
+                    kept.append(old)
+            self._pending = kept
+
+            records.append({"op": "add", "id": entry["id"], "entry": entry})
+            self._append(*records)
+            self._pending.append(entry)
+            self.stats["enqueued"] += 1
+
+        self.flush()
+        return entry["id"]
+
+    def flush(self):
+        """Publish entry pending berurutan (QoS 1, pipelined sampai max_inflight)"""
+        sent = 0
+        with self._lock:
+            self._drain_acks()
+            if not self.connected:
+                return 0
+            now = time.time()
+            expired = []
+            while self._pending and len(self._inflight) < self.max_inflight:
+                entry = self._pending[0]
+                if entry["expires"] < now:
+                    self._pending.pop(0)
+                    expired.append({"op": "done", "id": entry["id"]})
+                    self.stats["expired"] += 1
+                    print(f"⌛ Perintah kedaluwarsa dibuang: {entry['command']} -> {entry['topic']}")
+                    continue
+
+                result = self.client.publish(entry["topic"], json.dumps(entry["payload"]), qos=QOS)
+                if result.rc != 0:
+                    # Tetap di depan antrian, coba lagi saat flush berikutnya
+                    print(f"❌ Publish gagal (rc={result.rc}): {entry['command']}")
+                    break
+                self._pending.pop(0)
+                self._inflight[result.mid] = entry
+                sent += 1
+
+            self._append(*expired)
+            self._drain_acks()
+            if not self._pending and not self._inflight and self._journal_records:
+                self._compact()
+        return sent
+
+    def _drain_acks(self):
+        """PUBACK diterima: entry selesai, catat latency enqueue -> ack (dipanggil dengan lock).
+        Semua record 'done' satu drain ditulis sekaligus (satu fsync, bukan satu per PUBACK)."""
+        done = []
+        while self._acked:
+            mid, acked_at = self._acked.popleft()
+            entry = self._inflight.pop(mid, None)
+            if entry is None:
+                continue  # publish lain di client yang sama, bukan milik spool
+            done.append({"op": "done", "id": entry["id"]})
+
+            latency = acked_at - entry["created"]
+            flushed = self.stats["flushed"]
+            avg = self.stats["avg_flush_latency"] or 0.0
+            self.stats["flushed"] = flushed + 1
+            self.stats["last_flush_latency"] = latency
+            self.stats["avg_flush_latency"] = (avg * flushed + latency) / (flushed + 1)
+            print(f"✅ Command acked: {entry['command']} ({latency:.2f}s)")
+        self._append(*done)
+
+    # ---------- MQTT callbacks ----------
+    # Callback ini dipanggil dari thread network paho. Paho memegang mutex internalnya
+    # saat memanggil on_publish, jadi di sini tidak boleh menunggu self._lock (deadlock
+    # dengan flush() yang sedang publish). Pemanggil menjadwalkan flush() di thread UI.
+    def on_connect(self):
+        self.connected = True
+
+    def on_disconnect(self):
+        # Entry in-flight tetap disimpan paho dan dikirim ulang saat reconnect
+        self.connected = False
+
+    def on_publish(self, mid):
+        """Catat PUBACK; True jika mid milik spool (pemanggil perlu menjadwalkan flush).
+        PUBACK yang datang sebelum flush() mencatat mid-nya tetap diproses di akhir flush itu."""
+        self._acked.append((mid, time.time()))
+        return mid in self._inflight
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats, depth=len(self._pending), inflight=len(self._inflight))
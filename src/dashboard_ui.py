@@ -6,16 +6,22 @@ import numpy as np
 from scipy.interpolate import make_interp_spline
 import paho.mqtt.client as mqtt
 import json
-from datetime import datetime
 import threading
 import time
 
+from mqtt_topics import DEFAULT_DEVICE_ID, device_id_from_topic, device_topic
+from fleet_ingest import FleetState, ShardWriter
+from fleet_analytics import FleetAnalytics
+from command_spool import CommandSpool
+from group_command import DeviceRegistry, GroupBroadcast, format_report
+from pump_scheduler import PumpScheduler
+
 # Konfigurasi tema
 ctk.set_appearance_mode("Light")
 ctk.set_default_color_theme("blue")
 
 class DashboardApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, fleet_state=None):
         super().__init__()
 
         self.title("Smart Water Filter Dashboard with MQTT")
@@ -33,6 +39,25 @@ class DashboardApp(ctk.CTk):
         self.topic_data = "smartwater/data"
         self.topic_control = "smartwater/control"
         self.topic_status = "smartwater/status"
+        self.topic_fleet_data = "smartwater/+/data"
+        
+        # Perintah keluar lewat spool di disk agar tidak hilang saat koneksi putus
+        self.command_spool = CommandSpool(self.mqtt_client)
+        
+        # Group command: device + tag dari devices.json
+        self.topic_fleet_status = "smartwater/+/status"
+        self.device_registry = DeviceRegistry()
+        self.active_broadcast = None
+        
+        # Prediksi level air & rencana pompa dari history jarak_cm
+        self.pump_scheduler = PumpScheduler()
+        
+        # --- Fleet State (kolom NumPy per field) ---
+        # Tanpa fleet_state: simpan sendiri secara lokal. Dengan fleet_state (hasil
+        # FleetState.attach dari fleet_ingest): worker process yang menulis, UI hanya membaca.
+        self.fleet_state = fleet_state or FleetState.create(capacity=1024, shared=False)
+        self.fleet_writer = None if fleet_state else ShardWriter(self.fleet_state, 0)
+        self.fleet_analytics = FleetAnalytics(self.fleet_state)
         
         # --- Color Palette ---
         self.colors = {
@@ -91,6 +116,7 @@ class DashboardApp(ctk.CTk):
         self.chart_frame = None
         self.status_labels = {}
         self.metric_labels = {}
+        self.fleet_labels = {}
         self.status_container = None # Dipindahkan ke __init__ untuk referensi
         
         # --- Grid Configuration ---
@@ -114,6 +140,7 @@ class DashboardApp(ctk.CTk):
         self.mqtt_client.on_connect = self.on_mqtt_connect
         self.mqtt_client.on_message = self.on_mqtt_message
         self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
+        self.mqtt_client.on_publish = self.on_mqtt_publish
 
     def connect_mqtt(self):
         """Connect to MQTT broker"""
@@ -144,7 +171,13 @@ class DashboardApp(ctk.CTk):
             self.mqtt_connected = True
             self.mqtt_client.subscribe(self.topic_data)
             self.mqtt_client.subscribe(self.topic_status)
+            # Selalu subscribe: pump scheduler butuh data semua device, juga saat
+            # fleet state di-attach dari fleet_ingest (hanya penyimpanan yang dilewati)
+            self.mqtt_client.subscribe(self.topic_fleet_data)
+            self.mqtt_client.subscribe(self.topic_fleet_status)
             print(f"✅ Subscribed to: {self.topic_data}, {self.topic_status}")
+            self.command_spool.on_connect()
+            self.after(0, self.command_spool.flush)
             self.after(0, self.update_connection_status)
         else:
             print(f"❌ Failed to connect, return code {rc}")
@@ -154,13 +187,32 @@ class DashboardApp(ctk.CTk):
         """Callback when disconnected from MQTT"""
         print(f"⚠️ Disconnected from MQTT Broker (RC: {rc})")
         self.mqtt_connected = False
+        self.command_spool.on_disconnect()
         self.after(0, self.update_connection_status)
 
+    def on_mqtt_publish(self, client, userdata, mid):
+        """Callback PUBACK (QoS 1) dari broker"""
+        spool_ack = self.command_spool.on_publish(mid)
+        # Salin ke lokal: _run_broadcast bisa me-reset atribut ini dari thread lain
+        broadcast = self.active_broadcast
+        if broadcast:
+            broadcast.on_publish(mid)
+        # Flush lanjutan dijalankan di main thread, bukan di thread network paho,
+        # dan hanya untuk PUBACK milik spool (bukan group broadcast)
+        if spool_ack:
+            self.after(0, self.command_spool.flush)
+
     def on_mqtt_message(self, client, userdata, msg):
         """Callback when message received from MQTT"""
         try:
             payload = json.loads(msg.payload.decode())
             
+            # Balasan status untuk group broadcast tidak ditampilkan sebagai popup
+            broadcast = self.active_broadcast
+            if broadcast and msg.topic.endswith("/status"):
+                if broadcast.on_status(msg.topic, payload):
+                    return
+            
             if msg.topic == self.topic_data:
                 # Update data dari ESP32
                 self.tds_input = payload.get("tds_input", 0)
@@ -187,32 +239,104 @@ class DashboardApp(ctk.CTk):
                 message = payload.get("message", "")
                 print(f"📢 Status Update: {status} - {message}")
                 self.after(0, lambda: self.show_notification(status, message))
+            
+            # Setelah update single-device, agar error di sini tidak menggagalkannya
+            self.observe_fleet_data(msg.topic, payload)
                 
         except json.JSONDecodeError as e:
             print(f"❌ JSON decode error: {e}")
         except Exception as e:
             print(f"❌ Error parsing MQTT message: {e}")
 
+    def observe_fleet_data(self, topic, payload):
+        """Teruskan reading ke fleet state dan pump scheduler"""
+        device_id = device_id_from_topic(topic)
+        if device_id is None:
+            return
+        try:
+            # Semua topic data masuk ke fleet state (smartwater/data = device "default");
+            # fleet state hasil attach ditulis oleh worker fleet_ingest, bukan di sini
+            if self.fleet_writer:
+                self.fleet_writer.store(topic, payload)
+            
+            try:
+                filter_limit = int(payload.get("use_count", 0)) >= self.max_uses
+            except (TypeError, ValueError):
+                filter_limit = False
+            self.pump_scheduler.observe(
+                device_id,
+                payload.get("jarak_cm"),
+                payload.get("pump_on", False),
+                blocked=bool(payload.get("tds_high_output", False)) or filter_limit
+            )
+        except Exception as e:
+            print(f"❌ Error updating fleet data ({topic}): {e}")
+
     def publish_command(self, command):
-        """Publish command ke ESP32"""
+        """Publish command ke ESP32 (lewat spool, dikirim saat MQTT terhubung)"""
+        try:
+            self.command_spool.submit(self.topic_control, command)
+            if self.mqtt_connected:
+                print(f"✅ Command queued for sending: {command}")
+            else:
+                self.show_notification("QUEUED", f"MQTT tidak terhubung! {command} akan dikirim saat terhubung kembali")
+                print(f"📦 Command spooled (MQTT not connected): {command}")
+        except Exception as e:
+            print(f"❌ Error sending command: {e}")
+
+    def broadcast_group_command(self, command, tags=()):
+        """Kirim command ke semua device dengan tag tertentu (background thread)"""
         if not self.mqtt_connected:
+            # Group broadcast butuh koneksi live untuk mengumpulkan ack, jadi tidak di-spool
             self.show_notification("ERROR", "MQTT tidak terhubung!")
-            print("❌ Cannot send command: MQTT not connected")
             return
-            
-        payload = {
-            "command": command,
-            "timestamp": datetime.now().isoformat()
-        }
+        if self.active_broadcast:
+            self.show_notification("ERROR", "Group command lain masih berjalan")
+            return
+        
+        devices = self.device_registry.select(tags, known=self.fleet_state.device_ids())
+        if not devices:
+            self.show_notification("ERROR", f"Tidak ada device dengan tag: {', '.join(tags)}")
+            return
         
+        self.active_broadcast = GroupBroadcast(self.mqtt_client, devices, command)
+        print(f"📣 Group command {command} -> {len(devices)} device (tags: {list(tags)})")
+        threading.Thread(target=self._run_broadcast, args=(self.active_broadcast,), daemon=True).start()
+
+    def _run_broadcast(self, broadcast):
         try:
-            result = self.mqtt_client.publish(self.topic_control, json.dumps(payload))
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                print(f"✅ Command sent successfully: {command}")
-            else:
-                print(f"❌ Failed to send command: {command}")
+            report = broadcast.run()
+            summary = format_report(report)
+            print(f"📋 Group command report:\n{summary}")
+            status = "SUCCESS" if not report["failed_devices"] else "PARTIAL"
+            self.after(0, lambda: self.show_notification(status, summary))
         except Exception as e:
-            print(f"❌ Error sending command: {e}")
+            print(f"❌ Error running group command: {e}")
+        finally:
+            self.active_broadcast = None
+
+    def run_pump_schedule(self):
+        """Kirim rencana START/STOP_PUMP yang jatuh tempo (hanya jika Auto Pump aktif)"""
+        try:
+            # Saat OFF rencana dibiarkan di scheduler (tidak dicatat terkirim), jadi
+            # START yang sudah jatuh tempo langsung dikirim begitu switch dinyalakan
+            if not self.auto_pump_switch.get():
+                return
+            for device_id, command in self.pump_scheduler.due_commands():
+                print(f"🗓️ Scheduled {command} -> {device_id}")
+                self.command_spool.submit(device_topic(device_id, "control"), command)
+        except Exception as e:
+            print(f"❌ Error running pump schedule: {e}")
+
+    def format_eta(self, seconds):
+        """Format detik menjadi teks singkat untuk status"""
+        if seconds is None:
+            return "-"
+        if seconds < 60:
+            return f"{seconds:.0f} s"
+        if seconds < 3600:
+            return f"{seconds / 60:.0f} min"
+        return f"{seconds / 3600:.1f} h"
 
     def update_connection_status(self):
         """Update status koneksi di UI"""
@@ -223,6 +347,13 @@ class DashboardApp(ctk.CTk):
             else:
                 self.connection_indicator.configure(fg_color=self.colors['status_critical'])
                 self.connection_label.configure(text="Disconnected")
+            
+            metrics = self.command_spool.metrics()
+            latency = metrics['last_flush_latency']
+            latency_text = f" | Last flush: {latency:.2f}s" if latency is not None else ""
+            self.spool_label.configure(
+                text=f"Spool: {metrics['depth']} pending, {metrics['inflight']} in-flight{latency_text}"
+            )
 
     def get_filter_status(self):
         """Menghitung dan mengembalikan status filter"""
@@ -311,7 +442,10 @@ class DashboardApp(ctk.CTk):
     def periodic_update(self):
         """Periodic update untuk UI"""
         if not self.is_closing:
+            self.run_pump_schedule()
+            self.command_spool.flush()
             self.update_connection_status()
+            self.update_fleet_summary()
             self.after(1000, self.periodic_update)
 
     def create_main_content_frame(self,):
@@ -383,6 +517,22 @@ class DashboardApp(ctk.CTk):
             font=self.fonts['small'],
             text_color=self.colors['text_secondary']
         ).pack(side="left")
+        
+        self.spool_label = ctk.CTkLabel(
+            inner,
+            text="Spool: 0 pending",
+            font=self.fonts['small'],
+            text_color=self.colors['text_secondary']
+        )
+        self.spool_label.pack(side="right")
+        
+        self.auto_pump_switch = ctk.CTkSwitch(
+            inner,
+            text="Auto Pump Schedule",
+            font=self.fonts['small'],
+            text_color=self.colors['text_secondary']
+        )
+        self.auto_pump_switch.pack(side="right", padx=(0, 16))
 
     def create_stats_cards(self, parent):
         """Stats cards untuk sensor data"""
@@ -532,6 +682,38 @@ class DashboardApp(ctk.CTk):
             command=lambda: self.publish_command("RESET_USE_COUNT")
         )
         btn_reset.grid(row=0, column=3, padx=8, sticky="ew")
+        
+        # Group command: tag (dipisah koma, kosong = semua device) + command
+        self.group_tags_entry = ctk.CTkEntry(
+            btn_container,
+            placeholder_text="Tags (mis. gedung-a, lantai-2)",
+            font=self.fonts['body'],
+            height=40
+        )
+        self.group_tags_entry.grid(row=1, column=0, columnspan=2, padx=8, pady=(12, 0), sticky="ew")
+        
+        self.group_command_menu = ctk.CTkOptionMenu(
+            btn_container,
+            values=["ALARM_OFF", "RESET_USE_COUNT", "STOP_PUMP", "START_PUMP"],
+            font=self.fonts['body'],
+            height=40
+        )
+        self.group_command_menu.grid(row=1, column=2, padx=8, pady=(12, 0), sticky="ew")
+        
+        btn_group = ctk.CTkButton(
+            btn_container,
+            text="📣 Send to Group",
+            font=self.fonts['body_bold'],
+            fg_color=self.colors['text_secondary'],
+            hover_color="#475569",
+            height=40,
+            corner_radius=12,
+            command=lambda: self.broadcast_group_command(
+                self.group_command_menu.get(),
+                [tag.strip() for tag in self.group_tags_entry.get().split(",") if tag.strip()]
+            )
+        )
+        btn_group.grid(row=1, column=3, padx=8, pady=(12, 0), sticky="ew")
 
 
     def create_charts_and_status(self, parent):
@@ -541,10 +723,12 @@ class DashboardApp(ctk.CTk):
         
         content_frame.grid_columnconfigure(0, weight=2)
         content_frame.grid_columnconfigure(1, weight=1)
+        content_frame.grid_columnconfigure(2, weight=1)
         content_frame.grid_rowconfigure(0, weight=1)
         
         self.create_chart_section(content_frame)
         self.create_system_status_section(content_frame)
+        self.create_fleet_summary_section(content_frame)
 
     def create_chart_section(self, parent):
         """Section grafik"""
@@ -622,12 +806,22 @@ class DashboardApp(ctk.CTk):
             alarm_color = self.colors['status_critical'] if self.alarm_active else self.colors['status_ok']
             filter_status, filter_color = self.get_filter_status() 
             
+            forecast = self.pump_scheduler.forecast(DEFAULT_DEVICE_ID)
+            low_eta = forecast['seconds_to_low']
+            low_color = self.colors['status_warning'] if low_eta is not None and low_eta < 600 else self.colors['text_dark']
+            if forecast['next_command']:
+                plan_text = f"{forecast['next_command']} in {self.format_eta(forecast['next_in'])}"
+            else:
+                plan_text = "-"
+            
             status_items = [
                 ("💧 Water Level", self.water_level, water_color),
                 ("⚡ Pump Status", "ON" if self.pump_on else "OFF", pump_color),
                 ("🔔 Alarm", "ACTIVE" if self.alarm_active else "OFF", alarm_color),
                 ("♻️ Filter Health", f"{filter_status} ({self.use_count}x)", filter_color), 
                 ("📏 Distance", f"{self.jarak_cm} cm", self.colors['text_dark']),
+                ("⏳ RENDAH dalam", self.format_eta(low_eta), low_color),
+                ("🗓️ Pump Plan", plan_text, self.colors['text_dark']),
                 # Gabungan TDS/EC Input
                 ("🌊 TDS/EC In", f"{self.tds_input} PPM / {self.ec_input:.0f} µS/cm", self.colors['text_dark']), 
                 # Gabungan TDS/EC Output
@@ -657,6 +851,103 @@ class DashboardApp(ctk.CTk):
         except Exception as e:
             print(f"❌ Error updating system status: {e}")
 
+    def create_fleet_summary_section(self, parent):
+        """Section ringkasan fleet di samping System Status"""
+        fleet_card = ctk.CTkFrame(
+            parent,
+            corner_radius=16,
+            fg_color=self.colors['surface_light'],
+            border_width=1,
+            border_color=self.colors['border_light']
+        )
+        fleet_card.grid(row=0, column=2, sticky="nsew", padx=(24, 0))
+        
+        ctk.CTkLabel(
+            fleet_card,
+            text="🏭 Fleet Summary",
+            font=self.fonts['subtitle'],
+            text_color=self.colors['text_dark'],
+            anchor="w"
+        ).pack(anchor="w", padx=24, pady=(24, 16))
+        
+        fleet_container = ctk.CTkScrollableFrame(fleet_card, fg_color="transparent", width=200)
+        fleet_container.pack(fill="both", expand=True, padx=24, pady=(0, 24))
+        
+        # Label dibuat sekali, selanjutnya hanya di-configure (tidak destroy/rebuild)
+        fleet_items = [
+            ("devices", "📡 Devices"),
+            ("eff_p10", "📉 Efficiency P10"),
+            ("eff_p50", "📊 Efficiency P50"),
+            ("eff_p90", "📈 Efficiency P90"),
+            ("tds_high", "⚠️ TDS Out Tinggi"),
+            ("level_RENDAH", "🔻 Level RENDAH"),
+            ("level_SEDANG", "➖ Level SEDANG"),
+            ("level_PENUH", "🔺 Level PENUH"),
+        ]
+        for key, label in fleet_items:
+            frame = ctk.CTkFrame(fleet_container, fg_color="transparent")
+            frame.pack(fill="x", pady=8)
+            
+            ctk.CTkLabel(
+                frame,
+                text=label,
+                font=self.fonts['body'],
+                text_color=self.colors['text_dark']
+            ).pack(side="left")
+            
+            self.fleet_labels[key] = ctk.CTkLabel(
+                frame,
+                text="-",
+                font=self.fonts['body_bold'],
+                text_color=self.colors['text_dark']
+            )
+            self.fleet_labels[key].pack(side="right")
+        
+        ctk.CTkLabel(
+            fleet_container,
+            text=f"🔥 Worst {self.fleet_analytics.worst_n} (TDS Output)",
+            font=self.fonts['body_bold'],
+            text_color=self.colors['text_dark'],
+            anchor="w"
+        ).pack(anchor="w", pady=(16, 4))
+        
+        self.fleet_labels['worst'] = ctk.CTkLabel(
+            fleet_container,
+            text="-",
+            font=self.fonts['small'],
+            text_color=self.colors['text_secondary'],
+            justify="left",
+            anchor="w"
+        )
+        self.fleet_labels['worst'].pack(anchor="w")
+
+    def update_fleet_summary(self):
+        """Update panel fleet jika ada reading baru"""
+        try:
+            if not self.fleet_labels or not self.fleet_analytics.refresh():
+                return
+            
+            summary = self.fleet_analytics.summary()
+            
+            self.fleet_labels['devices'].configure(text=str(summary['devices']))
+            for q, value in summary['efficiency'].items():
+                text = f"{value:.0f}%" if value is not None else "-"
+                self.fleet_labels[f"eff_p{q}"].configure(text=text)
+            
+            high_pct = summary['tds_high_percent']
+            high_color = self.colors['status_critical'] if high_pct > 0 else self.colors['status_ok']
+            self.fleet_labels['tds_high'].configure(text=f"{high_pct:.1f}%", text_color=high_color)
+            
+            for level, (count, high) in summary['by_water_level'].items():
+                self.fleet_labels[f"level_{level}"].configure(text=f"{count} ({high} TDS↑)")
+            
+            worst_text = "\n".join(
+                f"{device_id}: {tds:.0f} PPM" for device_id, tds in summary['worst']
+            )
+            self.fleet_labels['worst'].configure(text=worst_text or "-")
+        except Exception as e:
+            print(f"❌ Error updating fleet summary: {e}")
+
     def update_graph_data(self):
         """Update graph dengan data terbaru"""
         try:
@@ -734,6 +1025,9 @@ class DashboardApp(ctk.CTk):
             self.mqtt_client.disconnect()
             print("✅ MQTT disconnected")
             
+            # Fleet state lokal dilepas; shared memory milik fleet_ingest hanya di-close
+            self.fleet_state.close()
+            
             # Close matplotlib
             if hasattr(self, 'chart_canvas') and self.chart_canvas:
                 self.chart_canvas.get_tk_widget().destroy()
@@ -0,0 +1,123 @@
+"""
+Agregat fleet-wide (vectorized) di atas kolom FleetState.
+
+Histogram filter_efficiency, jumlah tds_high_output dan group-by water_level
+di-update secara inkremental: setiap refresh() hanya memproses baris yang
+`seq`-nya berubah sejak refresh sebelumnya, jadi bekerja sama baiknya untuk
+FleetState lokal (dashboard) maupun shared memory dari fleet_ingest.
+"""
+import numpy as np
+
+from fleet_ingest import WATER_LEVEL_CODES, WATER_LEVEL_NAMES
+
+EFFICIENCY_BINS = 100  # resolusi 1% untuk percentile
+LEVEL_COUNT = len(WATER_LEVEL_CODES)
+
+
+class FleetAnalytics:
+    """Summary fleet: distribusi efisiensi, % TDS output tinggi, worst-N TDS output"""
+
+    def __init__(self, state, worst_n=5):
+        self.state = state
+        self.worst_n = worst_n
+
+        capacity = state.capacity
+        self._seen_seq = np.zeros(capacity, dtype=np.uint32)
+        # Kontribusi terakhir setiap baris ke agregat (-1 = belum/tidak dihitung)
+        self._eff_bin = np.full(capacity, -1, dtype=np.int16)
+        self._level = np.full(capacity, -1, dtype=np.int8)
+        self._high = np.zeros(capacity, dtype=bool)
+
+        self.efficiency_hist = np.zeros(EFFICIENCY_BINS, dtype=np.int64)
+        self.level_counts = np.zeros(LEVEL_COUNT, dtype=np.int64)
+        self.high_by_level = np.zeros(LEVEL_COUNT, dtype=np.int64)
+        self.tds_high_count = 0
+        self.device_count = 0
+
+    def refresh(self):
+        """Terapkan perubahan sejak refresh terakhir; True jika ada yang berubah"""
+        columns = self.state.columns
+        rows = self.state.active_rows()
+        self.device_count = len(rows)
+
+        seq = columns["seq"][rows]
+        # Baris dengan seq ganjil sedang ditulis -> ambil di refresh berikutnya
+        changed_mask = (seq != self._seen_seq[rows]) & (seq % 2 == 0)
+        if not changed_mask.any():
+            return False
+        changed = rows[changed_mask]
+
+        # 1. Cabut kontribusi lama
+        old_bins = self._eff_bin[changed]
+        np.subtract.at(self.efficiency_hist, old_bins[old_bins >= 0], 1)
+        old_levels = self._level[changed]
+        old_high = self._high[changed]
+        valid = old_levels >= 0
+        np.subtract.at(self.level_counts, old_levels[valid], 1)
+        np.subtract.at(self.high_by_level, old_levels[valid & old_high], 1)
+        self.tds_high_count -= int(old_high.sum())
+
+        # 2. Tambahkan kontribusi baru
+        measured = columns["probe_input_in_water"][changed] & columns["probe_output_in_water"][changed]
+        efficiency = columns["filter_efficiency"][changed]
+        new_bins = np.clip(efficiency.astype(np.int16), 0, EFFICIENCY_BINS - 1)
+        new_bins[~measured] = -1
+        np.add.at(self.efficiency_hist, new_bins[new_bins >= 0], 1)
+
+        new_levels = columns["water_level"][changed].astype(np.int8)
+        new_levels[(new_levels < 0) | (new_levels >= LEVEL_COUNT)] = -1
+        new_high = columns["tds_high_output"][changed].astype(bool)
+        valid = new_levels >= 0
+        np.add.at(self.level_counts, new_levels[valid], 1)
+        np.add.at(self.high_by_level, new_levels[valid & new_high], 1)
+        self.tds_high_count += int(new_high.sum())
+
+        self._eff_bin[changed] = new_bins
+        self._level[changed] = new_levels
+        self._high[changed] = new_high
+        self._seen_seq[changed] = seq[changed_mask]
+        return True
+
+    def efficiency_percentiles(self, quantiles=(10, 50, 90)):
+        """Percentile dari histogram (resolusi 1%), None jika belum ada data"""
+        total = int(self.efficiency_hist.sum())
+        if total == 0:
+            return {q: None for q in quantiles}
+        cumulative = np.cumsum(self.efficiency_hist)
+        targets = np.ceil(np.asarray(quantiles, dtype=float) / 100.0 * total).clip(1, total)
+        bins = np.searchsorted(cumulative, targets)
+        return {q: float(b) + 0.5 for q, b in zip(quantiles, bins)}
+
+    def tds_high_percent(self):
+        if self.device_count == 0:
+            return 0.0
+        return self.tds_high_count / self.device_count * 100.0
+
+    def worst_devices(self, n=None):
+        """Top-N device dengan TDS output tertinggi (argpartition, O(devices))"""
+        n = n or self.worst_n
+        rows = self.state.active_rows()
+        if not len(rows):
+            return []
+        tds_output = self.state.columns["tds_output"][rows]
+        k = min(n, len(rows))
+        top = np.argpartition(tds_output, -k)[-k:]
+        top = top[np.argsort(tds_output[top])[::-1]]
+        ids = self.state.device_ids(rows[top])
+        return [(device_id, float(tds)) for device_id, tds in zip(ids, tds_output[top])]
+
+    def by_water_level(self):
+        """Group-by water_level -> (jumlah device, jumlah tds_high_output)"""
+        return {
+            WATER_LEVEL_NAMES[code]: (int(self.level_counts[code]), int(self.high_by_level[code]))
+            for code in range(LEVEL_COUNT)
+        }
+
+    def summary(self):
+        return {
+            "devices": self.device_count,
+            "efficiency": self.efficiency_percentiles(),
+            "tds_high_percent": self.tds_high_percent(),
+            "worst": self.worst_devices(),
+            "by_water_level": self.by_water_level(),
+        }
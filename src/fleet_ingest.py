@@ -0,0 +1,503 @@
+"""
+Sharded multi-core ingestion untuk fleet Smart Water Filter.
+
+Satu proses dispatcher memegang koneksi MQTT (`smartwater/+/data`), tidak
+men-decode JSON, dan hanya meneruskan payload mentah per batch ke worker
+process pemilik shard device (device_id di-hash dengan crc32). Worker men-decode
+dan menulis langsung ke kolom NumPy di `multiprocessing.shared_memory`. Proses
+UI/API cukup attach ke shared memory yang sama dan membaca kolom tanpa copy.
+
+Jalankan:
+    python src/fleet_ingest.py --workers 4
+    python src/fleet_ingest.py --bench
+"""
+import argparse
+import json
+import multiprocessing as mp
+import struct
+import time
+import zlib
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from mqtt_topics import device_id_from_topic
+
+DEVICE_ID_BYTES = 32
+
+WATER_LEVEL_CODES = {"RENDAH": 0, "SEDANG": 1, "PENUH": 2}
+WATER_LEVEL_NAMES = {code: name for name, code in WATER_LEVEL_CODES.items()}
+
+# Satu kolom per field payload `smartwater/data` (lihat publishSensorData di main.cpp)
+PAYLOAD_FIELDS = [
+    ("jarak_cm", np.float32),
+    ("tds_input", np.float32),
+    ("ec_input", np.float32),
+    ("suhu_input", np.float32),
+    ("tds_output", np.float32),
+    ("ec_output", np.float32),
+    ("suhu_output", np.float32),
+    ("filter_efficiency", np.float32),
+    ("use_count", np.int32),
+    ("probe_input_in_water", np.bool_),
+    ("probe_output_in_water", np.bool_),
+    ("pump_on", np.bool_),
+    ("alarm_active", np.bool_),
+    ("low_water", np.bool_),
+    ("tds_high_input", np.bool_),
+    ("tds_high_output", np.bool_),
+    ("water_level", np.int8),
+    ("timestamp", np.float64),
+]
+
+# Header di offset 0: magic, capacity, shards. attach() membaca layout dari sini,
+# bukan dari argumen pemanggil yang bisa saja salah.
+HEADER_FORMAT = "<8sqq"
+HEADER_MAGIC = b"SWFLEET1"
+HEADER_BYTES = struct.calcsize(HEADER_FORMAT)
+
+# Kolom tambahan milik ingestion (bukan dari payload)
+META_FIELDS = [
+    ("device_id", f"S{DEVICE_ID_BYTES}"),
+    ("seq", np.uint32),
+    ("received_at", np.float64),
+]
+
+
+def shard_of(device_id, n_shards):
+    """Shard stabil lintas proses (hash() Python di-randomize per proses)"""
+    return zlib.crc32(device_id.encode()) % n_shards
+
+
+def decode_reading(payload):
+    """Validasi payload dict menjadi tuple nilai sesuai urutan PAYLOAD_FIELDS"""
+    values = []
+    for name, dtype in PAYLOAD_FIELDS:
+        if name == "water_level":
+            values.append(WATER_LEVEL_CODES.get(payload.get(name, "SEDANG"), -1))
+        elif dtype is np.bool_:
+            values.append(bool(payload.get(name, False)))
+        else:
+            values.append(float(payload.get(name, 0) or 0))
+    return values
+
+
+class FleetState:
+    """Device state kolom-per-field di atas satu buffer (shared memory atau lokal)"""
+
+    def __init__(self, capacity=None, shards=None, name=None, create=False, shared=True, track=False):
+        self.shm = None
+
+        if not shared or create:
+            shards = shards or 1
+            layout = self._layout(capacity, shards)
+            size = layout[-1][2] + layout[-1][3]
+            if not shared:
+                buf = bytearray(size)
+            else:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                buf = self.shm.buf
+            struct.pack_into(HEADER_FORMAT, buf, 0, HEADER_MAGIC, capacity, shards)
+        else:
+            if track:
+                # Resource_tracker sama dengan pemilik, registrasinya dibiarkan
+                self.shm = shared_memory.SharedMemory(name=name)
+            else:
+                try:
+                    # Python 3.13+: jangan biarkan resource_tracker proses pembaca meng-unlink
+                    self.shm = shared_memory.SharedMemory(name=name, track=False)
+                except TypeError:
+                    # Python < 3.13: attach tetap didaftarkan ke resource_tracker, yang akan
+                    # meng-unlink segment milik ingestor saat proses ini exit
+                    self.shm = shared_memory.SharedMemory(name=name)
+                    resource_tracker.unregister(self.shm._name, "shared_memory")
+            buf = self.shm.buf
+            capacity, shards = self._read_header(buf, name, capacity, shards)
+            layout = self._layout(capacity, shards)
+
+        self.capacity = capacity
+        self.shards = shards
+        self.rows_per_shard = capacity // shards
+        self.name = self.shm.name if self.shm else None
+        self.columns = {}
+        for field, dtype, offset, nbytes in layout:
+            length = shards if field == "shard_used" else capacity
+            self.columns[field] = np.ndarray((length,), dtype=dtype, buffer=buf, offset=offset)
+
+        # Shared memory & bytearray baru selalu zero-filled, jadi tidak perlu reset kolom
+        self.shard_used = self.columns.pop("shard_used")
+        self._owner = create and shared
+
+    def _read_header(self, buf, name, capacity, shards):
+        """Layout dari header segment; ValueError jika bukan FleetState atau tidak cocok"""
+        if len(buf) < HEADER_BYTES:
+            self.shm.close()
+            raise ValueError(f"Shared memory {name} bukan FleetState")
+        magic, real_capacity, real_shards = struct.unpack_from(HEADER_FORMAT, buf, 0)
+        if magic != HEADER_MAGIC:
+            self.shm.close()
+            raise ValueError(f"Shared memory {name} bukan FleetState")
+        if capacity not in (None, real_capacity) or shards not in (None, real_shards):
+            self.shm.close()
+            raise ValueError(
+                f"Layout FleetState {name} tidak cocok: capacity={real_capacity}, shards={real_shards} "
+                f"(diminta capacity={capacity}, shards={shards})"
+            )
+        return real_capacity, real_shards
+
+    @staticmethod
+    def _layout(capacity, shards):
+        layout = []
+        offset = HEADER_BYTES
+        for field, dtype in [("shard_used", np.int64)] + META_FIELDS + PAYLOAD_FIELDS:
+            dtype = np.dtype(dtype)
+            offset = (offset + 7) & ~7  # align 8 byte
+            length = shards if field == "shard_used" else capacity
+            nbytes = dtype.itemsize * length
+            layout.append((field, dtype, offset, nbytes))
+            offset += nbytes
+        return layout
+
+    @classmethod
+    def create(cls, capacity, shards=1, shared=True):
+        return cls(capacity, shards, create=True, shared=shared)
+
+    @classmethod
+    def attach(cls, name, capacity=None, shards=None, track=False):
+        """Attach ke FleetState yang sudah ada; layout dibaca dari header segment.
+        capacity/shards opsional, jika diberikan harus sama dengan header (ValueError).
+        track=True hanya untuk proses yang berbagi resource_tracker dengan pemilik
+        (child process atau proses pemilik itu sendiri)."""
+        return cls(capacity, shards, name=name, create=False, track=track)
+
+    def active_rows(self):
+        """Index baris yang sudah berisi minimal satu reading, dari semua shard"""
+        ranges = [
+            np.arange(shard * self.rows_per_shard, shard * self.rows_per_shard + int(used))
+            for shard, used in enumerate(self.shard_used)
+        ]
+        rows = np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+        # seq == 0: baris baru dialokasikan tapi belum pernah ditulis
+        return rows[self.columns["seq"][rows] != 0]
+
+    def device_ids(self, rows=None):
+        rows = self.active_rows() if rows is None else rows
+        return [raw.decode() for raw in self.columns["device_id"][rows]]
+
+    def allocate_row(self, shard, device_id):
+        """Ambil baris kosong di shard ini; hanya dipanggil oleh writer shard tersebut"""
+        used = int(self.shard_used[shard])
+        if used >= self.rows_per_shard:
+            return None
+        row = shard * self.rows_per_shard + used
+        self.columns["device_id"][row] = device_id.encode()[:DEVICE_ID_BYTES]
+        self.shard_used[shard] = used + 1
+        return row
+
+    def write_row(self, row, values, received_at):
+        """Tulis satu reading; seq ganjil selama penulisan (seqlock)"""
+        seq = self.columns["seq"]
+        seq[row] += 1
+        for (name, _), value in zip(PAYLOAD_FIELDS, values):
+            self.columns[name][row] = value
+        self.columns["received_at"][row] = received_at
+        seq[row] += 1
+
+    def close(self):
+        self.columns = {}
+        self.shard_used = None
+        if self.shm:
+            self.shm.close()
+            if self._owner:
+                self.shm.unlink()
+            self.shm = None
+
+
+class ShardWriter:
+    """Decode + simpan pesan untuk satu shard; transport-agnostic (MQTT atau benchmark)"""
+
+    def __init__(self, state, shard):
+        self.state = state
+        self.shard = shard
+        self._owners = {}  # topic -> device_id (None = bukan shard ini)
+        self._rows = {}    # topic -> row, hanya setelah reading valid pertama
+        self.processed = 0
+        self.dropped = 0
+
+    def route(self, topic):
+        """device_id jika topic milik shard ini, selain itu None"""
+        if topic in self._owners:
+            return self._owners[topic]
+
+        device_id = device_id_from_topic(topic)
+        if device_id is not None and shard_of(device_id, self.state.shards) != self.shard:
+            device_id = None
+        self._owners[topic] = device_id
+        return device_id
+
+    def _row_for(self, topic, device_id):
+        row = self._rows.get(topic)
+        if row is None:
+            row = self.state.allocate_row(self.shard, device_id)
+            if row is None:
+                print(f"⚠️ Shard {self.shard} penuh, device {device_id} diabaikan")
+                self._owners[topic] = None
+                return None
+            self._rows[topic] = row
+        return row
+
+    def handle(self, topic, raw_payload):
+        if self.route(topic) is None:
+            return False
+        try:
+            payload = json.loads(raw_payload)
+        except ValueError as e:
+            self.dropped += 1
+            print(f"❌ Payload invalid dari {topic}: {e}")
+            return False
+        return self.store(topic, payload)
+
+    def store(self, topic, payload):
+        """Simpan payload yang sudah di-decode (dipakai dashboard agar tidak parse dua kali)"""
+        device_id = self.route(topic)
+        if device_id is None:
+            return False
+        try:
+            values = decode_reading(payload)
+        except (ValueError, TypeError, AttributeError) as e:
+            self.dropped += 1
+            print(f"❌ Payload invalid dari {topic}: {e}")
+            return False
+        # Baris baru dialokasikan hanya setelah payload valid (tidak ada device fantom)
+        row = self._row_for(topic, device_id)
+        if row is None:
+            return False
+        self.state.write_row(row, values, time.time())
+        self.processed += 1
+        return True
+
+
+DISPATCH_BATCH = 256     # pesan per batch ke antrian shard (amortisasi biaya pickle/IPC)
+DISPATCH_LINGER = 0.05   # detik maksimum batch parsial menunggu sebelum dikirim
+DATA_TOPICS = ("smartwater/+/data", "smartwater/data")
+
+
+class Dispatcher:
+    """Route (topic, payload mentah) ke antrian worker sesuai shard device, per batch"""
+
+    def __init__(self, queues, batch_size=DISPATCH_BATCH):
+        self.queues = queues
+        self.batch_size = batch_size
+        self._batches = [[] for _ in queues]
+        self._routes = {}  # topic -> shard (None = bukan topic data)
+        self.dispatched = 0
+
+    def dispatch(self, topic, payload):
+        shard = self._routes.get(topic, -1)
+        if shard == -1:
+            device_id = device_id_from_topic(topic)
+            shard = None if device_id is None else shard_of(device_id, len(self.queues))
+            self._routes[topic] = shard
+        if shard is None:
+            return False
+
+        batch = self._batches[shard]
+        batch.append((topic, bytes(payload)))
+        if len(batch) >= self.batch_size:
+            self.queues[shard].put(batch)
+            self._batches[shard] = []
+        self.dispatched += 1
+        return True
+
+    def flush(self):
+        for shard, batch in enumerate(self._batches):
+            if batch:
+                self.queues[shard].put(batch)
+                self._batches[shard] = []
+
+    def close(self):
+        """Kirim sisa batch lalu sentinel None agar worker berhenti"""
+        self.flush()
+        for queue in self.queues:
+            queue.put(None)
+
+
+def run_shard_worker(shard, shm_name, capacity, shards, queue, results=None):
+    """Entry point worker process: decode + simpan batch dari dispatcher"""
+    state = FleetState.attach(shm_name, capacity, shards, track=True)
+    writer = ShardWriter(state, shard)
+    busy = 0.0
+    try:
+        while True:
+            batch = queue.get()
+            if batch is None:
+                break
+            start = time.perf_counter()
+            for topic, payload in batch:
+                writer.handle(topic, payload)
+            busy += time.perf_counter() - start
+    finally:
+        if results is not None:
+            results.put((shard, writer.processed, busy))
+        state.close()
+
+
+def run_dispatcher(queues, broker, port, stop_event):
+    """Entry point proses dispatcher: satu koneksi MQTT, parsing JSON di worker"""
+    import paho.mqtt.client as mqtt
+
+    dispatcher = Dispatcher(queues)
+    client = mqtt.Client(f"Fleet_Dispatcher_{int(time.time())}")
+
+    def on_connect(c, userdata, flags, rc):
+        if rc == 0:
+            c.subscribe([(topic, 0) for topic in DATA_TOPICS])
+            print(f"✅ Dispatcher subscribed: {', '.join(DATA_TOPICS)}")
+
+    client.on_connect = on_connect
+    client.on_message = lambda c, userdata, msg: dispatcher.dispatch(msg.topic, msg.payload)
+
+    try:
+        client.connect(broker, port, 60)
+        # loop() di thread ini juga, jadi dispatch() & flush() tidak perlu lock
+        while not stop_event.is_set():
+            client.loop(timeout=DISPATCH_LINGER)
+            dispatcher.flush()
+    except Exception as e:
+        print(f"❌ Dispatcher MQTT error: {e}")
+    finally:
+        client.disconnect()
+        dispatcher.close()
+
+
+class FleetIngestor:
+    """Satu proses dispatcher MQTT + N worker process, pemilik shared memory FleetState"""
+
+    def __init__(self, workers=4, capacity=4096, broker="broker.emqx.io", port=1883):
+        self.workers = workers
+        self.broker = broker
+        self.port = port
+        self.state = FleetState.create(capacity, shards=workers)
+        self.stop_event = mp.Event()
+        self.queues = [mp.Queue() for _ in range(workers)]
+        self.processes = []
+
+    def start(self):
+        for shard in range(self.workers):
+            proc = mp.Process(
+                target=run_shard_worker,
+                args=(shard, self.state.name, self.state.capacity, self.workers, self.queues[shard]),
+                daemon=True,
+            )
+            proc.start()
+            self.processes.append(proc)
+
+        dispatcher = mp.Process(
+            target=run_dispatcher,
+            args=(self.queues, self.broker, self.port, self.stop_event),
+            daemon=True,
+        )
+        dispatcher.start()
+        self.processes.append(dispatcher)
+        print(f"🚀 Fleet ingestion: {self.workers} worker, shm={self.state.name}")
+
+    def stop(self):
+        # Dispatcher mengirim sentinel ke worker setelah stop_event
+        self.stop_event.set()
+        for proc in self.processes:
+            proc.join(timeout=5)
+        self.processes = []
+        self.state.close()
+
+
+# ============================================
+# BENCHMARK (tanpa broker)
+# ============================================
+def _synthetic_stream(devices, messages):
+    """Stream (topic, payload bytes) seperti yang diterima dispatcher dari broker"""
+    rng = np.random.default_rng(1304)
+    payloads = []
+    for i in range(devices):
+        tds_in = int(rng.integers(200, 900))
+        tds_out = int(tds_in * rng.uniform(0.05, 0.6))
+        payloads.append(json.dumps({
+            "jarak_cm": int(rng.integers(2, 30)),
+            "tds_input": tds_in, "ec_input": tds_in / 0.64, "suhu_input": 26.5,
+            "tds_output": tds_out, "ec_output": tds_out / 0.64, "suhu_output": 26.1,
+            "filter_efficiency": (tds_in - tds_out) / tds_in * 100.0,
+            "use_count": int(rng.integers(0, 50)),
+            "probe_input_in_water": True, "probe_output_in_water": True,
+            "pump_on": bool(i % 2), "alarm_active": False, "low_water": False,
+            "tds_high_input": False, "tds_high_output": tds_out > 1000,
+            "water_level": "SEDANG", "timestamp": i,
+        }).encode())
+    topics = [f"smartwater/ESP32_{i:04d}/data" for i in range(devices)]
+    return [(topics[i % devices], payloads[i % devices]) for i in range(messages)]
+
+
+def benchmark(max_workers=8, devices=1000, messages=200_000):
+    """Throughput end-to-end dispatcher -> antrian -> decode+store untuk 1..max_workers worker"""
+    print(f"📊 Benchmark: {devices} device, {messages} pesan, {mp.cpu_count()} CPU")
+    print(f"{'workers':>8} {'msg/s':>12} {'speedup':>8} {'dispatch s':>11} {'max busy s':>11}")
+
+    stream = _synthetic_stream(devices, messages)
+    baseline = None
+    n = 1
+    while n <= max_workers:
+        state = FleetState.create(max(devices * 2, 64), shards=n)
+        queues = [mp.Queue() for _ in range(n)]
+        results = mp.Queue()
+        procs = [
+            mp.Process(target=run_shard_worker,
+                       args=(shard, state.name, state.capacity, n, queues[shard], results))
+            for shard in range(n)
+        ]
+        for proc in procs:
+            proc.start()
+
+        # Proses ini berperan sebagai dispatcher (pengganti on_message paho)
+        dispatcher = Dispatcher(queues)
+        start = time.perf_counter()
+        for topic, payload in stream:
+            dispatcher.dispatch(topic, payload)
+        dispatcher.close()
+        dispatch_seconds = time.perf_counter() - start
+
+        stats = [results.get() for _ in procs]
+        elapsed = time.perf_counter() - start
+        for proc in procs:
+            proc.join()
+        state.close()
+
+        processed = sum(count for _, count, _ in stats)
+        rate = processed / elapsed if elapsed else 0.0
+        baseline = baseline or rate
+        max_busy = max(busy for _, _, busy in stats)
+        print(f"{n:>8} {rate:>12,.0f} {rate / baseline:>7.2f}x {dispatch_seconds:>11.2f} {max_busy:>11.2f}")
+        n *= 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Smart Water Filter fleet ingestion")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--capacity", type=int, default=4096)
+    parser.add_argument("--broker", default="broker.emqx.io")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--bench", action="store_true", help="benchmark 1..8 worker tanpa broker")
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(messages=args.messages)
+    else:
+        ingestor = FleetIngestor(args.workers, args.capacity, args.broker, args.port)
+        ingestor.start()
+        try:
+            while True:
+                time.sleep(5)
+                rows = ingestor.state.active_rows()
+                print(f"📡 {len(rows)} device aktif")
+        except KeyboardInterrupt:
+            print("\n🛑 Stopping fleet ingestion...")
+        finally:
+            ingestor.stop()
@@ -0,0 +1,267 @@
+"""
+Broadcast satu perintah ke sekelompok device (dipilih lewat tag).
+
+Publish dilakukan QoS 1 dengan pacing (pesan/detik) dan jendela in-flight
+(maksimum PUBACK yang belum diterima), sehingga broker tidak dibanjiri.
+Balasan status tiap device (`smartwater/<device>/status`) dikumpulkan
+menjadi satu report.
+
+Korelasi balasan bersifat best-effort: firmware tidak mengirim balik
+`request_id`, jadi balasan SUCCESS/REJECT pertama dari device yang ditarget
+dianggap ack (bisa saja milik perintah lain yang dikirim bersamaan). Status lain
+seperti ONLINE saat reconnect diabaikan.
+
+Benchmark dengan 1000 device simulasi (tanpa broker):
+    python src/group_command.py --bench
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from mqtt_topics import device_id_from_topic, device_topic
+
+QOS = 1
+ACK_STATUSES = {"SUCCESS", "REJECT"}  # status firmware yang merupakan balasan perintah
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "devices.json")
+
+
+class DeviceRegistry:
+    """Daftar device dan tag-nya, dari file JSON {"device_id": ["tag", ...]}"""
+
+    def __init__(self, path=DEFAULT_REGISTRY_PATH):
+        self.path = path
+        self.tags = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.tags = {device: set(tags) for device, tags in json.load(f).items()}
+
+    def select(self, tags=(), known=()):
+        """Device yang memiliki SEMUA tag; tanpa tag = semua device (termasuk `known`)"""
+        tags = set(tags)
+        if not tags:
+            return sorted(set(self.tags) | set(known))
+        return sorted(device for device, device_tags in self.tags.items() if tags <= device_tags)
+
+
+class GroupBroadcast:
+    """Satu broadcast berjalan: pacing, window in-flight, dan pengumpulan ack"""
+
+    def __init__(self, client, devices, command, rate=50.0, window=20, reply_timeout=10.0,
+                 ack_timeout=10.0):
+        self.client = client
+        self.devices = list(devices)
+        self.command = command
+        self.rate = rate
+        self.window = window
+        self.reply_timeout = reply_timeout
+        self.ack_timeout = ack_timeout  # batas tunggu slot window sebelum in-flight dianggap hilang
+        self.request_id = uuid.uuid4().hex[:8]
+
+        self._cond = threading.Condition()
+        self._inflight = {}       # mid -> device_id (menunggu PUBACK)
+        self._early_acks = set()  # PUBACK yang datang selama publish() berjalan, sebelum mid tercatat
+        self._publishing = False
+        self._waiting_reply = set()
+
+        self.results = {device: "PENDING" for device in self.devices}
+        self.started = None
+        self.finished = None
+
+    # ---------- callback dari thread network paho (tidak pernah memanggil paho) ----------
+    def on_publish(self, mid):
+        with self._cond:
+            device = self._inflight.pop(mid, None)
+            if device is None:
+                # Client dipakai bersama spool: PUBACK lain hanya dicatat selama publish()
+                # broadcast ini berjalan, dan dibuang setelahnya (mid paho berputar di 65535)
+                if self._publishing:
+                    self._early_acks.add(mid)
+                return
+            self._mark_broker_acked(device)
+            self._cond.notify_all()
+
+    def on_status(self, topic, payload):
+        device = device_id_from_topic(topic, "status")
+        status = payload.get("status", "")
+        if status not in ACK_STATUSES:
+            return False
+        with self._cond:
+            if device not in self._waiting_reply:
+                return False
+            self._waiting_reply.discard(device)
+            self.results[device] = "SUCCESS" if status == "SUCCESS" else f"REJECT: {payload.get('message', status)}"
+            self._cond.notify_all()
+            return True
+
+    def _mark_broker_acked(self, device):
+        # Dipanggil dengan lock; status balasan device mungkin sudah datang duluan
+        if self.results[device] == "SENT":
+            self.results[device] = "BROKER_ACK"
+
+    def _expire_inflight(self):
+        # Dipanggil dengan lock; PUBACK tidak datang (mis. koneksi putus), lanjutkan broadcast
+        for device in self._inflight.values():
+            self.results[device] = "NO_BROKER_ACK"
+            self._waiting_reply.discard(device)
+        self._inflight.clear()
+
+    # ---------- eksekusi ----------
+    def run(self):
+        """Kirim ke semua device lalu tunggu balasan; return report"""
+        self.started = time.perf_counter()
+        interval = 1.0 / self.rate if self.rate else 0.0
+        next_send = self.started
+
+        for device in self.devices:
+            with self._cond:
+                window_deadline = time.perf_counter() + self.ack_timeout
+                while len(self._inflight) >= self.window:
+                    remaining = window_deadline - time.perf_counter()
+                    if remaining <= 0:
+                        print(f"⚠️ {len(self._inflight)} PUBACK tidak datang dalam {self.ack_timeout:.1f}s")
+                        self._expire_inflight()
+                        break
+                    self._cond.wait(min(0.5, remaining))
+
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_send = max(next_send + interval, time.perf_counter() - interval)
+
+            payload = {
+                "command": self.command,
+                "timestamp": datetime.now().isoformat(),
+                "request_id": self.request_id,
+            }
+            with self._cond:
+                self.results[device] = "SENT"
+                self._waiting_reply.add(device)
+                self._publishing = True
+
+            # publish() di luar lock: paho bisa memanggil on_publish sambil memegang mutexnya
+            result = self.client.publish(device_topic(device, "control"), json.dumps(payload), qos=QOS)
+
+            with self._cond:
+                if result.rc != 0:
+                    self.results[device] = f"FAILED: rc={result.rc}"
+                    self._waiting_reply.discard(device)
+                elif result.mid in self._early_acks:
+                    self._mark_broker_acked(device)
+                else:
+                    self._inflight[result.mid] = device
+                self._early_acks.clear()
+                self._publishing = False
+
+        deadline = time.perf_counter() + self.reply_timeout
+        with self._cond:
+            while (self._waiting_reply or self._inflight) and time.perf_counter() < deadline:
+                self._cond.wait(max(0.0, min(0.5, deadline - time.perf_counter())))
+            for device in self._waiting_reply:
+                if self.results[device] == "SENT":
+                    self.results[device] = "NO_BROKER_ACK"
+                elif self.results[device] == "BROKER_ACK":
+                    self.results[device] = "NO_REPLY"
+            self._waiting_reply.clear()
+
+        self.finished = time.perf_counter()
+        return self.report()
+
+    def report(self):
+        counts = {}
+        for status in self.results.values():
+            key = status.split(":")[0]
+            counts[key] = counts.get(key, 0) + 1
+        duration = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        return {
+            "request_id": self.request_id,
+            "command": self.command,
+            "total": len(self.devices),
+            "counts": counts,
+            "duration": duration,
+            "failed_devices": sorted(d for d, s in self.results.items() if s != "SUCCESS"),
+            "results": dict(self.results),
+        }
+
+
+def format_report(report, max_listed=10):
+    """Ringkasan report untuk notifikasi/console"""
+    counts = ", ".join(f"{key}={value}" for key, value in sorted(report["counts"].items()))
+    lines = [
+        f"{report['command']} -> {report['total']} device dalam {report['duration']:.1f}s",
+        counts,
+    ]
+    failed = report["failed_devices"]
+    if failed:
+        listed = ", ".join(failed[:max_listed])
+        more = f" (+{len(failed) - max_listed})" if len(failed) > max_listed else ""
+        lines.append(f"Gagal/tanpa balasan: {listed}{more}")
+    return "\n".join(lines)
+
+
+# ============================================
+# BENCHMARK (broker & device simulasi)
+# ============================================
+class _PublishResult:
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+
+class SimulatedFleetClient:
+    """Pengganti paho Client: PUBACK setelah broker_rtt, balasan device setelah device_rtt"""
+
+    def __init__(self, broker_rtt=0.02, device_rtt=0.15, reject_rate=0.01, seed=1304):
+        self.broker_rtt = broker_rtt
+        self.device_rtt = device_rtt
+        self.reject_rate = reject_rate
+        self.random = random.Random(seed)
+        self.broadcast = None
+        self._mid = 0
+        self._lock = threading.Lock()
+
+    def publish(self, topic, payload, qos=0):
+        with self._lock:
+            self._mid += 1
+            mid = self._mid
+            jitter = self.random.uniform(0.5, 1.5)
+            rejected = self.random.random() < self.reject_rate
+        device = device_id_from_topic(topic, "control")
+        threading.Timer(self.broker_rtt * jitter, self.broadcast.on_publish, (mid,)).start()
+        reply = {"status": "REJECT", "message": "Water level penuh"} if rejected else {"status": "SUCCESS"}
+        threading.Timer(self.device_rtt * jitter, self.broadcast.on_status,
+                        (device_topic(device, "status"), reply)).start()
+        return _PublishResult(0, mid)
+
+
+def benchmark(devices=1000):
+    """Waktu selesai broadcast ke N device untuk beberapa setting pacing/window"""
+    device_ids = [f"ESP32_{i:04d}" for i in range(devices)]
+    settings = [(100, 10), (100, 50), (500, 50), (1000, 100), (0, 200)]
+
+    print(f"📊 Group broadcast benchmark: {devices} device simulasi")
+    print(f"{'rate/s':>8} {'window':>7} {'seconds':>8} {'success':>8} {'other':>6}")
+    for rate, window in settings:
+        client = SimulatedFleetClient()
+        broadcast = GroupBroadcast(client, device_ids, "ALARM_OFF", rate=rate, window=window)
+        client.broadcast = broadcast
+        report = broadcast.run()
+        success = report["counts"].get("SUCCESS", 0)
+        rate_text = str(rate) if rate else "max"
+        print(f"{rate_text:>8} {window:>7} {report['duration']:>8.2f} {success:>8} {devices - success:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Smart Water Filter group command")
+    parser.add_argument("--bench", action="store_true", help="benchmark 1000 device simulasi")
+    parser.add_argument("--devices", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.devices)
+    else:
+        parser.print_help()
@@ -0,0 +1,25 @@
+"""
+Topic MQTT Smart Water Filter (tanpa dependency, dipakai semua modul dashboard).
+
+Firmware multi-device memakai `smartwater/<device_id>/<kind>`; firmware lama
+(satu perangkat) memakai `smartwater/<kind>` dan dipetakan ke DEFAULT_DEVICE_ID.
+"""
+
+DEFAULT_DEVICE_ID = "default"
+
+
+def device_topic(device_id, kind):
+    """Topic per device; device default memakai topic lama tanpa device_id"""
+    if device_id == DEFAULT_DEVICE_ID:
+        return f"smartwater/{kind}"
+    return f"smartwater/{device_id}/{kind}"
+
+
+def device_id_from_topic(topic, kind="data"):
+    """`smartwater/<device>/<kind>` -> device, `smartwater/<kind>` -> default, lainnya None"""
+    parts = topic.split("/")
+    if len(parts) == 3 and parts[0] == "smartwater" and parts[2] == kind:
+        return parts[1]
+    if topic == f"smartwater/{kind}":
+        return DEFAULT_DEVICE_ID
+    return None
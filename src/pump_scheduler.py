@@ -0,0 +1,235 @@
+"""
+Prediksi level air dan penjadwalan pompa dari history `jarak_cm`.
+
+`jarak_cm` adalah jarak sensor ke permukaan air: makin besar, makin sedikit air.
+Per device disimpan estimator laju (cm/detik) yang di-update inkremental setiap
+sample (EWMA), terpisah untuk pompa mati (konsumsi) dan pompa hidup (pengisian).
+Dari laju itu scheduler memprediksi kapan tangki mencapai RENDAH dan merencanakan
+START_PUMP/STOP_PUMP. Rencana disimpan di heap dengan invalidasi lazy, jadi satu
+sample hanya menyentuh rencana device itu sendiri.
+
+Benchmark replay sample simulasi:
+    python src/pump_scheduler.py --bench
+"""
+import argparse
+import heapq
+import math
+import random
+import threading
+import time
+
+# Sama dengan firmware (main.cpp)
+JARAK_PENUH_CM = 5
+JARAK_RENDAH_CM = 10
+JARAK_INVALID_CM = 400  # ukurJarak() mengembalikan 400 jika tidak ada echo
+
+
+class RateEstimator:
+    """EWMA laju perubahan jarak_cm, terpisah untuk pompa hidup/mati"""
+
+    def __init__(self, tau=120.0):
+        self.tau = tau
+        self.last_time = None
+        self.last_jarak = None
+        self.last_pump_on = None
+        self.consumption_rate = None  # cm/s, positif = air berkurang
+        self.refill_rate = None       # cm/s, negatif = air bertambah
+
+    def update(self, now, jarak_cm, pump_on):
+        if self.last_time is not None and self.last_pump_on == pump_on:
+            dt = now - self.last_time
+            if dt > 0:
+                rate = (jarak_cm - self.last_jarak) / dt
+                alpha = 1.0 - math.exp(-dt / self.tau)
+                if pump_on:
+                    old = self.refill_rate
+                    self.refill_rate = rate if old is None else old + alpha * (rate - old)
+                else:
+                    old = self.consumption_rate
+                    self.consumption_rate = rate if old is None else old + alpha * (rate - old)
+        # Saat pompa berubah status, laju sebelumnya tidak dipakai (transien)
+        self.last_time = now
+        self.last_jarak = jarak_cm
+        self.last_pump_on = pump_on
+
+    def seconds_until(self, target_cm, pump_on):
+        """Perkiraan detik sampai jarak mencapai target, None jika tidak menuju ke sana"""
+        if self.last_jarak is None:
+            return None
+        rate = self.refill_rate if pump_on else self.consumption_rate
+        if not rate:
+            return None
+        remaining = target_cm - self.last_jarak
+        if remaining == 0:
+            return 0.0
+        seconds = remaining / rate
+        return seconds if seconds >= 0 else None
+
+
+class PumpScheduler:
+    """Rencana START_PUMP/STOP_PUMP per device, diperbarui per sample"""
+
+    def __init__(self, lead_time=30.0, replan_tolerance=5.0, min_rate=1e-4, tau=120.0, cooldown=60.0):
+        self.lead_time = lead_time                  # START sebelum RENDAH tercapai
+        self.replan_tolerance = replan_tolerance    # perubahan < ini tidak menyentuh heap
+        self.min_rate = min_rate                    # cm/s, di bawah ini dianggap diam
+        self.tau = tau
+        self.cooldown = cooldown                    # jeda sebelum perintah yang sama direncanakan lagi
+
+        self._lock = threading.Lock()
+        self._estimators = {}
+        self._plans = {}    # device -> (due, command, version)
+        self._versions = {}
+        self._heap = []     # (due, version, device, command)
+        self._dispatched = {}  # device -> (command, waktu) terakhir yang dikeluarkan
+
+    def observe(self, device_id, jarak_cm, pump_on, now=None, blocked=False):
+        """Masukkan satu sample; `blocked` = filter limit/TDS tinggi (START pasti ditolak).
+        Sample dengan jarak_cm tidak valid (None, string, 0, 400) diabaikan."""
+        try:
+            jarak_cm = float(jarak_cm)
+        except (TypeError, ValueError):
+            return
+        if not 0 < jarak_cm < JARAK_INVALID_CM:  # juga menolak NaN
+            return
+        pump_on = bool(pump_on)
+        now = time.time() if now is None else now
+        with self._lock:
+            estimator = self._estimators.get(device_id)
+            if estimator is None:
+                estimator = self._estimators[device_id] = RateEstimator(self.tau)
+            estimator.update(now, jarak_cm, pump_on)
+            self._replan(device_id, estimator, now, pump_on, blocked)
+
+    def _replan(self, device_id, estimator, now, pump_on, blocked):
+        command, due = None, None
+        if pump_on:
+            rate = estimator.refill_rate
+            if rate is not None and rate < -self.min_rate:
+                seconds = estimator.seconds_until(JARAK_PENUH_CM, pump_on=True)
+                if seconds is not None:
+                    command, due = "STOP_PUMP", now + seconds
+        elif not blocked:
+            rate = estimator.consumption_rate
+            if estimator.last_jarak >= JARAK_RENDAH_CM:
+                command, due = "START_PUMP", now
+            elif rate is not None and rate > self.min_rate:
+                seconds = estimator.seconds_until(JARAK_RENDAH_CM, pump_on=False)
+                if seconds is not None:
+                    command, due = "START_PUMP", now + max(0.0, seconds - self.lead_time)
+
+        last = self._dispatched.get(device_id)
+        if command is not None and last is not None and last[0] == command and now - last[1] < self.cooldown:
+            command = None  # tunggu firmware melaporkan status pompa baru
+
+        current = self._plans.get(device_id)
+        if command is None:
+            if current is not None:
+                self._invalidate(device_id)
+            return
+        if current is not None and current[1] == command and abs(current[0] - due) < self.replan_tolerance:
+            return  # rencana lama masih cukup akurat, heap tidak disentuh
+
+        version = self._invalidate(device_id)
+        self._plans[device_id] = (due, command, version)
+        heapq.heappush(self._heap, (due, version, device_id, command))
+        # Buang entry basi jika heap jauh lebih besar dari jumlah rencana aktif
+        # (juga saat due_commands() tidak dipanggil, mis. Auto Pump OFF)
+        if len(self._heap) > 4 * len(self._plans) + 64:
+            self._heap = [item for item in self._heap if self._versions.get(item[2]) == item[1]]
+            heapq.heapify(self._heap)
+
+    def _invalidate(self, device_id):
+        version = self._versions.get(device_id, 0) + 1
+        self._versions[device_id] = version
+        self._plans.pop(device_id, None)
+        return version
+
+    def due_commands(self, now=None):
+        """Ambil perintah yang jatuh tempo: list (device_id, command)"""
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, version, device_id, command = heapq.heappop(self._heap)
+                if self._versions.get(device_id) != version:
+                    continue  # rencana sudah diganti
+                self._invalidate(device_id)
+                self._dispatched[device_id] = (command, now)
+                due.append((device_id, command))
+        return due
+
+    def forecast(self, device_id, now=None):
+        """Prediksi untuk UI: detik sampai RENDAH dan rencana pompa berikutnya"""
+        now = time.time() if now is None else now
+        with self._lock:
+            estimator = self._estimators.get(device_id)
+            plan = self._plans.get(device_id)
+            seconds_to_low = None
+            if estimator is not None and estimator.last_jarak is not None:
+                if estimator.last_jarak >= JARAK_RENDAH_CM:
+                    seconds_to_low = 0.0
+                elif not estimator.last_pump_on:
+                    seconds_to_low = estimator.seconds_until(JARAK_RENDAH_CM, pump_on=False)
+            return {
+                "seconds_to_low": seconds_to_low,
+                "consumption_rate": estimator.consumption_rate if estimator else None,
+                "refill_rate": estimator.refill_rate if estimator else None,
+                "next_command": plan[1] if plan else None,
+                "next_in": max(0.0, plan[0] - now) if plan else None,
+            }
+
+
+# ============================================
+# BENCHMARK (replay sample simulasi)
+# ============================================
+def benchmark(devices=1000, ticks=100):
+    """Biaya observe() + due_commands() untuk `devices` tangki, satu sample per detik"""
+    rng = random.Random(1304)
+    # Setiap tangki: jarak awal, laju konsumsi/pengisian (cm/s), status pompa
+    tanks = [
+        [rng.uniform(5.0, 9.0), rng.uniform(0.002, 0.02), rng.uniform(0.01, 0.05), False]
+        for _ in range(devices)
+    ]
+    device_ids = [f"ESP32_{i:04d}" for i in range(devices)]
+    samples = []
+    for tick in range(ticks):
+        row = []
+        for device_id, tank in zip(device_ids, tanks):
+            jarak, consume, refill, pump_on = tank
+            if pump_on and jarak <= JARAK_PENUH_CM:
+                tank[3] = pump_on = False
+            elif not pump_on and jarak >= JARAK_RENDAH_CM:
+                tank[3] = pump_on = True
+            jarak += -refill if pump_on else consume
+            tank[0] = jarak
+            # Sensor ultrasonik melaporkan cm bulat
+            row.append((device_id, round(jarak), pump_on))
+        samples.append(row)
+
+    scheduler = PumpScheduler()
+    planned = 0
+    start = time.perf_counter()
+    for tick, row in enumerate(samples):
+        for device_id, jarak, pump_on in row:
+            scheduler.observe(device_id, jarak, pump_on, now=float(tick))
+        planned += len(scheduler.due_commands(now=float(tick)))
+    elapsed = time.perf_counter() - start
+
+    total = devices * ticks
+    print(f"📊 Pump scheduler: {devices} device x {ticks} sample = {total:,} sample")
+    print(f"   {elapsed:.3f}s total, {elapsed / total * 1e6:.2f} µs/sample, "
+          f"{planned} perintah jatuh tempo, heap={len(scheduler._heap)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Smart Water Filter pump scheduler")
+    parser.add_argument("--bench", action="store_true", help="replay sample simulasi")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--ticks", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.devices, args.ticks)
+    else:
+        parser.print_help()
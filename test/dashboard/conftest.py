@@ -0,0 +1,36 @@
+import json
+import os
+import sys
+
+import pytest
+
+# Modul dashboard ada di src/ dan di-import tanpa package (seperti saat dijalankan langsung)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+
+class StubResult:
+    """Pengganti MQTTMessageInfo: hanya rc dan mid"""
+
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+
+class RecordingClient:
+    """Pengganti paho Client: catat publish, PUBACK tidak pernah dikirim otomatis"""
+
+    def __init__(self):
+        self.published = []  # (topic, payload dict, qos)
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append((topic, json.loads(payload), qos))
+        return StubResult(0, len(self.published))
+
+    @property
+    def commands(self):
+        return [payload["command"] for _, payload, _ in self.published]
+
+
+@pytest.fixture
+def make_client():
+    return RecordingClient
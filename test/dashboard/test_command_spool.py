@@ -0,0 +1,112 @@
+import os
+import time
+
+import pytest
+
+from command_spool import CommandSpool
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return str(tmp_path / "command_spool.jsonl")
+
+
+def test_pending_commands_survive_restart(make_client, journal):
+    spool = CommandSpool(make_client(), path=journal)
+    spool.submit("smartwater/control", "ALARM_OFF")
+    spool.submit("smartwater/control", "RESET_USE_COUNT")
+
+    client = make_client()
+    restarted = CommandSpool(client, path=journal)
+    assert restarted.metrics()["depth"] == 2
+
+    restarted.on_connect()
+    restarted.flush()
+    assert [(topic, payload["command"], qos) for topic, payload, qos in client.published] == [
+        ("smartwater/control", "ALARM_OFF", 1),
+        ("smartwater/control", "RESET_USE_COUNT", 1),
+    ]
+
+
+def test_acked_commands_are_not_replayed(make_client, journal):
+    client = make_client()
+    spool = CommandSpool(client, path=journal)
+    spool.on_connect()
+    spool.submit("smartwater/control", "ALARM_OFF")
+    assert spool.metrics()["inflight"] == 1
+
+    spool.on_publish(1)
+    spool.flush()
+    metrics = spool.metrics()
+    assert metrics["inflight"] == 0 and metrics["flushed"] == 1
+    assert metrics["last_flush_latency"] is not None
+
+    assert CommandSpool(make_client(), path=journal).metrics()["depth"] == 0
+
+
+def test_repeated_stop_pump_collapses(make_client, journal):
+    client = make_client()
+    spool = CommandSpool(client, path=journal)
+    for _ in range(3):
+        spool.submit("smartwater/control", "STOP_PUMP")
+    spool.submit("smartwater/ESP32_B/control", "STOP_PUMP")
+
+    metrics = spool.metrics()
+    assert metrics["depth"] == 2 and metrics["deduped"] == 2
+
+    spool.on_connect()
+    spool.flush()
+    assert client.commands == ["STOP_PUMP", "STOP_PUMP"]
+
+
+def test_last_pump_command_wins(make_client, journal):
+    client = make_client()
+    spool = CommandSpool(client, path=journal)
+    spool.submit("smartwater/control", "START_PUMP")
+    spool.submit("smartwater/control", "STOP_PUMP")
+    spool.on_connect()
+    spool.flush()
+    assert client.commands == ["STOP_PUMP"]
+
+
+def test_expired_commands_are_dropped(make_client, journal, monkeypatch):
+    client = make_client()
+    spool = CommandSpool(client, path=journal)
+    spool.submit("smartwater/control", "START_PUMP", ttl=60)
+    spool.submit("smartwater/control", "ALARM_OFF", ttl=600)
+
+    later = time.time() + 120
+    monkeypatch.setattr(time, "time", lambda: later)
+    spool.on_connect()
+    spool.flush()
+
+    assert client.commands == ["ALARM_OFF"]
+    assert spool.metrics()["expired"] == 1
+
+
+def test_acks_in_one_drain_share_one_fsync(make_client, journal, monkeypatch):
+    client = make_client()
+    spool = CommandSpool(client, path=journal, max_inflight=20)
+    spool.on_connect()
+    for i in range(20):
+        spool.submit(f"smartwater/ESP32_{i}/control", "ALARM_OFF")
+    assert spool.metrics()["inflight"] == 20
+
+    fsyncs = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (fsyncs.append(fd), real_fsync(fd)))
+    for mid in range(1, 21):
+        assert spool.on_publish(mid)
+    spool.flush()
+
+    # Satu append untuk 20 record 'done', satu lagi untuk compaction journal kosong
+    assert len(fsyncs) == 2
+    assert spool.metrics()["flushed"] == 20
+
+
+def test_foreign_puback_does_not_need_flush(make_client, journal):
+    spool = CommandSpool(make_client(), path=journal)
+    spool.on_connect()
+    spool.submit("smartwater/control", "ALARM_OFF")
+    assert not spool.on_publish(99)  # mid dari group broadcast di client yang sama
+    assert spool.on_publish(1)
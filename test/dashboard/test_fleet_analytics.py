@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from fleet_analytics import FleetAnalytics
+from fleet_ingest import FleetState, ShardWriter
+
+
+def reading(**fields):
+    payload = {
+        "tds_output": 100,
+        "filter_efficiency": 80.0,
+        "probe_input_in_water": True,
+        "probe_output_in_water": True,
+        "tds_high_output": False,
+        "water_level": "SEDANG",
+    }
+    payload.update(fields)
+    return json.dumps(payload)
+
+
+@pytest.fixture
+def fleet():
+    state = FleetState.create(64, shared=False)
+    return state, ShardWriter(state, 0), FleetAnalytics(state, worst_n=2)
+
+
+def test_counts_follow_rewritten_row(fleet):
+    state, writer, analytics = fleet
+    writer.handle("smartwater/A/data", reading(tds_output=1200, tds_high_output=True, water_level="RENDAH"))
+    writer.handle("smartwater/B/data", reading(filter_efficiency=40.0))
+    assert analytics.refresh()
+    assert analytics.tds_high_count == 1
+    assert analytics.by_water_level()["RENDAH"] == (1, 1)
+    assert analytics.efficiency_hist.sum() == 2
+
+    # Device A membaik: kontribusi lama harus dicabut, bukan ditambah
+    writer.handle("smartwater/A/data", reading(tds_output=50, filter_efficiency=95.0, water_level="PENUH"))
+    assert analytics.refresh()
+    assert analytics.tds_high_count == 0
+    assert analytics.by_water_level() == {"RENDAH": (0, 0), "SEDANG": (1, 0), "PENUH": (1, 0)}
+    assert analytics.efficiency_hist.sum() == 2
+    assert analytics.efficiency_hist[95] == 1 and analytics.efficiency_hist[80] == 0
+    assert not analytics.refresh()
+
+
+def test_summary_ignores_invalid_first_payload(fleet):
+    state, writer, analytics = fleet
+    writer.handle("smartwater/A/data", reading(tds_output=1200, tds_high_output=True))
+    writer.handle("smartwater/B/data", b"{bad json")
+    writer.handle("smartwater/C/data", reading(tds_output="abc"))
+    analytics.refresh()
+
+    summary = analytics.summary()
+    assert summary["devices"] == 1
+    assert summary["tds_high_percent"] == 100.0
+    assert summary["worst"] == [("A", 1200.0)]
+
+
+def test_dry_probe_excluded_from_efficiency(fleet):
+    state, writer, analytics = fleet
+    writer.handle("smartwater/A/data", reading(filter_efficiency=10.0))
+    writer.handle("smartwater/B/data", reading(filter_efficiency=0.0, probe_output_in_water=False))
+    analytics.refresh()
+    assert analytics.efficiency_percentiles((50,)) == {50: 10.5}
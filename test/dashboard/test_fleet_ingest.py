@@ -0,0 +1,159 @@
+import json
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import zlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import fleet_ingest
+from fleet_ingest import Dispatcher, FleetState, ShardWriter, run_shard_worker, shard_of
+
+
+class ListQueue:
+    """Pengganti mp.Queue untuk Dispatcher: simpan setiap batch yang dikirim"""
+
+    def __init__(self):
+        self.items = []
+
+    def put(self, item):
+        self.items.append(item)
+
+
+def reading(**fields):
+    payload = {"jarak_cm": 7, "tds_output": 120, "filter_efficiency": 75.0, "water_level": "SEDANG"}
+    payload.update(fields)
+    return json.dumps(payload).encode()
+
+
+# Di proses yang sama dengan pemilik segment, attach memakai track=True (resource_tracker sama)
+@pytest.fixture
+def shared_state():
+    state = FleetState.create(64, shards=4)
+    yield state
+    state.close()
+
+
+def test_attach_reads_layout_from_header(shared_state):
+    reader = FleetState.attach(shared_state.name, track=True)
+    try:
+        assert (reader.capacity, reader.shards) == (64, 4)
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize("layout", [{"shards": 2}, {"capacity": 128}, {"capacity": 64, "shards": 1}])
+def test_attach_rejects_wrong_layout(shared_state, layout):
+    with pytest.raises(ValueError):
+        FleetState.attach(shared_state.name, track=True, **layout)
+
+
+def test_attach_rejects_foreign_segment():
+    from multiprocessing import shared_memory
+
+    segment = shared_memory.SharedMemory(create=True, size=4096)
+    try:
+        with pytest.raises(ValueError):
+            FleetState.attach(segment.name, track=True)
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def test_shard_of_is_stable_across_processes():
+    devices = [f"ESP32_{i:04d}" for i in range(20)]
+    expected = [zlib.crc32(device.encode()) % 4 for device in devices]
+    assert [shard_of(device, 4) for device in devices] == expected
+
+    # hash() Python berbeda per proses; shard_of tidak boleh ikut berubah
+    code = f"from fleet_ingest import shard_of; print([shard_of(d, 4) for d in {devices!r}])"
+    child = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                           env={"PYTHONPATH": os.path.dirname(fleet_ingest.__file__), "PYTHONHASHSEED": "1304"})
+    assert child.stdout.strip() == str(expected)
+
+
+def test_dispatcher_batches_per_shard():
+    queues = [ListQueue(), ListQueue()]
+    dispatcher = Dispatcher(queues, batch_size=2)
+    topics = [f"smartwater/ESP32_{i}/data" for i in range(6)]
+    for topic in topics:
+        assert dispatcher.dispatch(topic, b"{}")
+    assert not dispatcher.dispatch("smartwater/ESP32_0/status", b"{}")
+    assert not dispatcher.dispatch("other/topic", b"{}")
+    dispatcher.close()
+
+    assert dispatcher.dispatched == 6
+    for shard, queue in enumerate(queues):
+        assert queue.items[-1] is None  # sentinel berhenti
+        batches = queue.items[:-1]
+        assert all(0 < len(batch) <= 2 for batch in batches)
+        routed = [topic for batch in batches for topic, _ in batch]
+        assert routed == [t for t in topics if shard_of(t.split("/")[1], 2) == shard]
+
+
+def test_worker_process_writes_shared_state():
+    state = FleetState.create(16, shards=1)
+    try:
+        queue = mp.Queue()
+        worker = mp.Process(target=run_shard_worker, args=(0, state.name, state.capacity, 1, queue))
+        worker.start()
+
+        dispatcher = Dispatcher([queue])
+        dispatcher.dispatch("smartwater/ESP32_A/data", reading(tds_output=300))
+        dispatcher.dispatch("smartwater/ESP32_B/data", b"not json")
+        dispatcher.dispatch("smartwater/data", reading(water_level="PENUH"))
+        dispatcher.dispatch("smartwater/ESP32_A/data", reading(tds_output=310, pump_on=True))
+        dispatcher.close()
+        worker.join(timeout=10)
+        assert worker.exitcode == 0
+
+        reader = FleetState.attach(state.name, track=True)
+        try:
+            rows = reader.active_rows()
+            assert reader.device_ids(rows) == ["ESP32_A", "default"]
+            columns = reader.columns
+            assert list(columns["tds_output"][rows]) == [310, 120]
+            assert list(columns["pump_on"][rows]) == [True, False]
+            assert list(columns["water_level"][rows]) == [1, 2]
+            # Dua kali ditulis -> seq 4, sekali -> seq 2; selalu genap setelah selesai
+            assert list(columns["seq"][rows]) == [4, 2]
+        finally:
+            reader.close()
+    finally:
+        state.close()
+
+
+def test_seq_is_odd_while_writing():
+    state = FleetState.create(4, shared=False)
+    writer = ShardWriter(state, 0)
+    writer.handle("smartwater/ESP32_A/data", reading())
+    row = int(state.active_rows()[0])
+    seq = state.columns["seq"]
+
+    class SeqProbe:
+        """Kolom pengganti: catat seq tepat saat nilai payload ditulis"""
+        seen = []
+
+        def __setitem__(self, index, value):
+            self.seen.append(int(seq[index]))
+
+    state.columns["tds_output"] = SeqProbe()
+    writer.handle("smartwater/ESP32_A/data", reading())
+    assert SeqProbe.seen == [3]
+    assert seq[row] == 4
+
+
+def test_full_shard_drops_new_devices():
+    state = FleetState.create(4, shards=2, shared=False)
+    writer = ShardWriter(state, 0)
+    devices = [f"ESP32_{i}" for i in range(40) if shard_of(f"ESP32_{i}", 2) == 0][:3]
+    results = [writer.handle(f"smartwater/{device}/data", reading()) for device in devices]
+
+    assert results == [True, True, False]
+    assert state.device_ids() == devices[:2]
+    # Device yang ditolak tetap ditolak, device lama tetap ditulis
+    assert not writer.handle(f"smartwater/{devices[2]}/data", reading())
+    assert writer.handle(f"smartwater/{devices[0]}/data", reading())
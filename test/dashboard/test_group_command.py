@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+
+import pytest
+
+from group_command import DeviceRegistry, GroupBroadcast, SimulatedFleetClient
+
+
+def start_broadcast(client, devices, **options):
+    broadcast = GroupBroadcast(client, devices, "ALARM_OFF", **options)
+    client.broadcast = broadcast
+    return broadcast
+
+
+@pytest.fixture
+def registry(tmp_path):
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps({
+        "ESP32_A": ["lantai1", "dapur"],
+        "ESP32_B": ["lantai1"],
+        "ESP32_C": ["lantai2", "dapur"],
+    }))
+    return DeviceRegistry(str(path))
+
+
+def test_registry_tags_are_and_matched(registry):
+    assert registry.select(["lantai1"]) == ["ESP32_A", "ESP32_B"]
+    assert registry.select(["lantai1", "dapur"]) == ["ESP32_A"]
+    assert registry.select(["lantai2", "lantai1"]) == []
+    # Device yang hanya terlihat di fleet state (tanpa tag) tidak ikut broadcast bertag
+    assert registry.select(["dapur"], known=["ESP32_Z"]) == ["ESP32_A", "ESP32_C"]
+
+
+def test_registry_without_tags_includes_known_devices(registry, tmp_path):
+    assert registry.select(known=["ESP32_Z", "ESP32_A"]) == ["ESP32_A", "ESP32_B", "ESP32_C", "ESP32_Z"]
+    assert DeviceRegistry(str(tmp_path / "missing.json")).select(known=["default"]) == ["default"]
+
+
+def test_rate_paces_publishes():
+    devices = [f"ESP32_{i}" for i in range(6)]
+    client = SimulatedFleetClient(broker_rtt=0.005, device_rtt=0.01, reject_rate=0)
+    report = start_broadcast(client, devices, rate=50, window=10, reply_timeout=1.0).run()
+    assert report["counts"] == {"SUCCESS": 6}
+    assert report["duration"] >= 5 / 50
+
+
+def test_window_limits_inflight():
+    class WindowProbe(SimulatedFleetClient):
+        max_inflight = 0
+
+        def publish(self, topic, payload, qos=0):
+            WindowProbe.max_inflight = max(WindowProbe.max_inflight, len(self.broadcast._inflight))
+            return super().publish(topic, payload, qos)
+
+    devices = [f"ESP32_{i}" for i in range(12)]
+    client = WindowProbe(broker_rtt=0.02, device_rtt=0.03, reject_rate=0)
+    report = start_broadcast(client, devices, rate=0, window=3, reply_timeout=1.0).run()
+    assert report["counts"] == {"SUCCESS": 12}
+    assert WindowProbe.max_inflight <= 2  # publish baru hanya jika in-flight < window
+
+
+def test_report_aggregates_success_and_reject():
+    devices = [f"ESP32_{i}" for i in range(10)]
+    client = SimulatedFleetClient(broker_rtt=0.005, device_rtt=0.02, reject_rate=0.5, seed=7)
+    report = start_broadcast(client, devices, rate=0, reply_timeout=1.0).run()
+
+    rejected = sorted(d for d, status in report["results"].items() if status.startswith("REJECT"))
+    assert report["counts"] == {"SUCCESS": 10 - len(rejected), "REJECT": len(rejected)}
+    assert 0 < len(rejected) < 10
+    assert report["failed_devices"] == rejected
+    assert report["results"][rejected[0]] == "REJECT: Water level penuh"
+
+
+def test_broker_ack_without_reply_becomes_no_reply():
+    devices = ["ESP32_A", "ESP32_B", "ESP32_C"]
+    client = SimulatedFleetClient(broker_rtt=0.005, device_rtt=0.6, reject_rate=0)
+    broadcast = start_broadcast(client, devices, rate=0, reply_timeout=0.2)
+    runner = threading.Thread(target=broadcast.run)
+    runner.start()
+    while broadcast.report()["counts"] != {"BROKER_ACK": 3}:
+        assert runner.is_alive()
+        time.sleep(0.005)
+    runner.join()
+    report = broadcast.report()
+    assert report["counts"] == {"NO_REPLY": 3}
+    assert report["failed_devices"] == devices
+
+
+def test_full_window_without_pubacks_does_not_block(make_client):
+    devices = [f"ESP32_{i}" for i in range(5)]
+    broadcast = GroupBroadcast(make_client(), devices, "ALARM_OFF", rate=0, window=2,
+                               reply_timeout=0.2, ack_timeout=0.1)
+    report = broadcast.run()
+    assert report["counts"] == {"NO_BROKER_ACK": 5}
+
+
+def test_online_status_is_not_taken_as_ack(make_client):
+    broadcast = GroupBroadcast(make_client(), ["ESP32_A"], "ALARM_OFF", rate=0, reply_timeout=1.0)
+    runner = threading.Thread(target=broadcast.run)
+    runner.start()
+    while broadcast.results["ESP32_A"] == "PENDING":
+        time.sleep(0.01)
+
+    assert not broadcast.on_status("smartwater/ESP32_A/status", {"status": "ONLINE", "message": "ESP32 Connected"})
+    assert broadcast.on_status("smartwater/ESP32_A/status", {"status": "REJECT", "message": "Water level penuh"})
+    runner.join()
+    assert broadcast.results["ESP32_A"] == "REJECT: Water level penuh"
+
+
+def test_foreign_pubacks_are_not_kept_as_early_acks(make_client):
+    client = make_client()
+    broadcast = GroupBroadcast(client, ["ESP32_A", "ESP32_B"], "ALARM_OFF", rate=0, reply_timeout=0.1)
+    # PUBACK spool (mid 2) sebelum broadcast mulai tidak boleh menandai ESP32_B
+    broadcast.on_publish(2)
+    report = broadcast.run()
+    assert report["counts"] == {"NO_BROKER_ACK": 2}
+    assert not broadcast._early_acks
+
+
+def test_puback_during_publish_is_matched(make_client):
+    class FastAckClient(make_client):
+        """PUBACK tiba sebelum publish() mengembalikan mid"""
+
+        def publish(self, topic, payload, qos=0):
+            result = super().publish(topic, payload, qos)
+            broadcast.on_publish(result.mid)
+            broadcast.on_publish(1000 + result.mid)  # PUBACK spool di saat yang sama
+            return result
+
+    broadcast = GroupBroadcast(FastAckClient(), ["ESP32_A", "ESP32_B"], "ALARM_OFF", rate=0, reply_timeout=0.1)
+    report = broadcast.run()
+    assert report["counts"] == {"NO_REPLY": 2}
+    assert not broadcast._early_acks
@@ -0,0 +1,19 @@
+from mqtt_topics import DEFAULT_DEVICE_ID, device_id_from_topic, device_topic
+
+
+def test_topic_round_trip():
+    for device_id in ("ESP32_0001", DEFAULT_DEVICE_ID):
+        for kind in ("data", "status", "control"):
+            assert device_id_from_topic(device_topic(device_id, kind), kind) == device_id
+
+
+def test_legacy_topics_map_to_default_device():
+    assert device_topic(DEFAULT_DEVICE_ID, "control") == "smartwater/control"
+    assert device_id_from_topic("smartwater/data") == DEFAULT_DEVICE_ID
+    assert device_id_from_topic("smartwater/status", "status") == DEFAULT_DEVICE_ID
+
+
+def test_other_topics_are_rejected():
+    assert device_id_from_topic("smartwater/ESP32_A/status") is None
+    assert device_id_from_topic("smartwater/a/b/data") is None
+    assert device_id_from_topic("other/ESP32_A/data") is None
@@ -0,0 +1,46 @@
+from pump_scheduler import PumpScheduler
+
+
+def test_invalid_jarak_samples_are_ignored():
+    scheduler = PumpScheduler()
+    for jarak in (None, "abc", float("nan"), 0, 400):
+        scheduler.observe("ESP32_A", jarak, False, now=0.0)
+    assert scheduler.forecast("ESP32_A", now=0.0)["seconds_to_low"] is None
+
+
+def test_start_planned_before_low_and_not_repeated_within_cooldown():
+    scheduler = PumpScheduler(lead_time=30.0, cooldown=60.0)
+    fired = []
+    jarak = 5.0
+    for tick in range(520):
+        scheduler.observe("ESP32_A", round(jarak), False, now=float(tick))
+        fired += [(tick, command) for _, command in scheduler.due_commands(now=float(tick))]
+        jarak += 0.01  # konsumsi 0.01 cm/s, RENDAH (10 cm) tercapai di detik ~450-500
+
+    assert fired and all(command == "START_PUMP" for _, command in fired)
+    assert fired[0][0] < 500
+    assert all(b - a >= 60 for (a, _), (b, _) in zip(fired, fired[1:]))
+
+
+def test_stop_planned_while_refilling():
+    scheduler = PumpScheduler()
+    jarak = 12.0
+    for tick in range(60):
+        scheduler.observe("ESP32_A", round(jarak), True, now=float(tick))
+        jarak -= 0.05
+    assert scheduler.forecast("ESP32_A", now=60.0)["next_command"] == "STOP_PUMP"
+
+
+def test_undrained_plans_stay_due_and_heap_stays_bounded():
+    # Auto Pump OFF: due_commands() tidak dipanggil selama sample terus masuk
+    scheduler = PumpScheduler(replan_tolerance=0.0)
+    devices = [f"ESP32_{i}" for i in range(20)]
+    for tick in range(300):
+        for i, device_id in enumerate(devices):
+            scheduler.observe(device_id, 6 + tick * 0.001 * (i + 1), False, now=float(tick))
+        scheduler.observe("ESP32_LOW", 12, False, now=float(tick))  # sudah RENDAH sejak awal
+
+    assert len(scheduler._heap) <= 4 * len(scheduler._plans) + 64
+    # Switch dinyalakan: START yang sudah jatuh tempo langsung keluar, tanpa tunggu cooldown
+    due = scheduler.due_commands(now=300.0)
+    assert due.count(("ESP32_LOW", "START_PUMP")) == 1